@@ -4,8 +4,9 @@ View and analyze user feedback with statistics and insights
 """
 import streamlit as st
 import pandas as pd
-from sqlalchemy.orm import Session
-from database import SessionLocal, Feedback
+import numpy as np
+from sqlalchemy import func, select
+from database import engine, Feedback
 from datetime import datetime, timedelta
 import plotly.express as px
 import plotly.graph_objects as go
@@ -17,6 +18,14 @@ st.set_page_config(
     layout="wide"
 )
 
+# Rows rendered per page in the feedback list
+PAGE_SIZE = 50
+ANSWER_PREVIEW_CHARS = 500
+
+# Time-series granularity options and the max points sent to Plotly
+GRANULARITIES = {"Day": "day", "Hour": "hour", "Minute": "minute"}
+MAX_CHART_POINTS = 800
+
 # Custom CSS
 st.markdown("""
 <style>
@@ -36,34 +45,100 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# Database session
-def get_db():
-    db = SessionLocal()
-    try:
-        return db
-    finally:
-        db.close()
+# Shared rating / date filter for dashboard queries
+def apply_filters(stmt, rating="All", days=None):
+    if rating != "All":
+        stmt = stmt.where(Feedback.rating == rating.lower())
+    if days is not None:
+        stmt = stmt.where(Feedback.timestamp >= datetime.now() - timedelta(days=days))
+    return stmt
 
-# Load feedback data
+# Load aggregate stats (one grouped query instead of every row)
+@st.cache_data(ttl=60)
+def load_stats():
+    stmt = select(Feedback.rating, func.count(Feedback.id)).group_by(Feedback.rating)
+    with engine.connect() as conn:
+        return dict(conn.execute(stmt).all())
+
+# SQL expression truncating the timestamp to the given granularity
+def time_bucket(freq="day"):
+    if freq == "day":
+        return func.date(Feedback.timestamp)
+    if engine.dialect.name == "sqlite":
+        fmt = {"hour": "%Y-%m-%d %H:00:00", "minute": "%Y-%m-%d %H:%M:00"}[freq]
+        return func.strftime(fmt, Feedback.timestamp)
+    return func.date_trunc(freq, Feedback.timestamp)
+
+# Load feedback counts per day (or hour / minute), optionally limited to the last N days / a rating
+@st.cache_data(ttl=60)
+def load_daily(days=None, rating="All", freq="day"):
+    bucket = time_bucket(freq)
+    stmt = apply_filters(
+        select(bucket.label('date'), func.count(Feedback.id).label('count')),
+        rating,
+        days
+    ).group_by(bucket).order_by(bucket)
+    return pd.read_sql_query(stmt, engine, parse_dates=['date'])
+
+# Serialize the filtered feedback to CSV once per filter combination
 @st.cache_data(ttl=60)
-def load_feedback_data():
-    db = get_db()
-    feedback = db.query(Feedback).all()
+def build_csv(rating="All", days=None):
+    return load_export(rating, days).to_csv(index=False).encode()
+
+# Largest-Triangle-Three-Buckets: pick n_out indices that preserve the line's visual shape
+def lttb(x, y, n_out):
+    n = len(x)
+    if n <= n_out or n_out < 3:
+        return np.arange(n)
     
-    data = []
-    for f in feedback:
-        data.append({
-            'id': f.id,
-            'session_id': f.session_id,
-            'message_id': f.message_id,
-            'question': f.question,
-            'answer': f.answer,
-            'rating': f.rating,
-            'timestamp': f.timestamp,
-            'user_comment': f.user_comment
-        })
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # n_out - 2 buckets between the (always kept) first and last points
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
     
-    return pd.DataFrame(data) if data else pd.DataFrame()
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+        
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(area.argmax())
+        selected[i + 1] = a
+    
+    return selected
+
+# Load one page of the latest feedback, only the columns the list renders
+@st.cache_data(ttl=60)
+def load_recent(limit, rating="All", days=None, offset=0):
+    stmt = apply_filters(
+        select(
+            Feedback.id,
+            Feedback.session_id,
+            Feedback.rating,
+            Feedback.timestamp,
+            Feedback.question,
+            # One extra char tells the view whether the answer was truncated
+            func.substr(Feedback.answer, 1, ANSWER_PREVIEW_CHARS + 1).label('answer')
+        ),
+        rating,
+        days
+    ).order_by(Feedback.timestamp.desc()).limit(limit).offset(offset)
+    
+    # pandas builds the columns straight from the DBAPI cursor (no ORM objects)
+    return pd.read_sql_query(stmt, engine, parse_dates=['timestamp'])
+
+# Load every column of the filtered feedback for export (cached as CSV bytes by build_csv)
+def load_export(rating="All", days=None):
+    stmt = apply_filters(select(*Feedback.__table__.columns), rating, days)\
+        .order_by(Feedback.timestamp.desc())
+    return pd.read_sql_query(stmt, engine, parse_dates=['timestamp'])
 
 # Header
 st.markdown("""
@@ -74,16 +149,16 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # Load data
-df = load_feedback_data()
+stats = load_stats()
 
-if df.empty:
+if not stats:
     st.info("📭 No feedback data available yet. Start chatting to see feedback!")
     st.stop()
 
 # Calculate metrics
-total_feedback = len(df)
-positive_count = len(df[df['rating'] == 'positive'])
-negative_count = len(df[df['rating'] == 'negative'])
+total_feedback = sum(stats.values())
+positive_count = stats.get('positive', 0)
+negative_count = stats.get('negative', 0)
 positive_rate = (positive_count / total_feedback * 100) if total_feedback > 0 else 0
 
 # Top metrics
@@ -133,15 +208,20 @@ with col1:
 
 with col2:
     st.subheader("📅 Feedback Over Time")
-    df['date'] = pd.to_datetime(df['timestamp']).dt.date
-    daily_feedback = df.groupby('date').size().reset_index(name='count')
+    granularity = st.radio("Granularity", list(GRANULARITIES), horizontal=True)
+    timeline = load_daily(freq=GRANULARITIES[granularity])
+    
+    # Downsample long series to roughly chart-width before plotting
+    if len(timeline) > MAX_CHART_POINTS:
+        keep = lttb(timeline['date'].values.astype('int64'), timeline['count'].values, MAX_CHART_POINTS)
+        timeline = timeline.iloc[keep]
     
     fig = px.line(
-        daily_feedback, 
+        timeline, 
         x='date', 
         y='count',
         markers=True,
-        title="Daily Feedback Count"
+        title=f"Feedback Count per {granularity}"
     )
     fig.update_traces(line_color='#C41E3A')
     fig.update_layout(height=300)
@@ -167,38 +247,40 @@ with col2:
         value=7
     )
 
-# Apply filters
-filtered_df = df.copy()
-
-if rating_filter != "All":
-    filtered_df = filtered_df[filtered_df['rating'] == rating_filter.lower()]
-
-date_threshold = datetime.now() - timedelta(days=days_filter)
-filtered_df['timestamp'] = pd.to_datetime(filtered_df['timestamp'])
-filtered_df = filtered_df[filtered_df['timestamp'] >= date_threshold]
+# Apply filters (counted in SQL, only one page of rows is fetched)
+filtered_count = int(load_daily(days_filter, rating_filter)['count'].sum())
+page_count = max(1, -(-filtered_count // PAGE_SIZE))
 
 st.divider()
 
 # Recent feedback table
-st.subheader(f"📋 Recent Feedback ({len(filtered_df)} items)")
+st.subheader(f"📋 Recent Feedback ({filtered_count} items)")
+
+page = st.number_input(
+    f"Page (of {page_count})",
+    min_value=1,
+    max_value=page_count,
+    value=1
+)
+filtered_df = load_recent(PAGE_SIZE, rating_filter, days_filter, offset=(page - 1) * PAGE_SIZE)
 
-for idx, row in filtered_df.sort_values('timestamp', ascending=False).iterrows():
+for row in filtered_df.itertuples(index=False):
     with st.expander(
-        f"{'👍' if row['rating'] == 'positive' else '👎'} {row['timestamp'].strftime('%Y-%m-%d %H:%M')} - {row['question'][:60]}..."
+        f"{'👍' if row.rating == 'positive' else '👎'} {row.timestamp.strftime('%Y-%m-%d %H:%M')} - {row.question[:60]}..."
     ):
         col1, col2 = st.columns([1, 3])
         
         with col1:
-            st.markdown(f"**Rating:** {'👍 Positive' if row['rating'] == 'positive' else '👎 Negative'}")
-            st.markdown(f"**Time:** {row['timestamp'].strftime('%Y-%m-%d %H:%M:%S')}")
-            st.markdown(f"**Session:** `{row['session_id'][:20]}...`")
+            st.markdown(f"**Rating:** {'👍 Positive' if row.rating == 'positive' else '👎 Negative'}")
+            st.markdown(f"**Time:** {row.timestamp.strftime('%Y-%m-%d %H:%M:%S')}")
+            st.markdown(f"**Session:** `{row.session_id[:20]}...`")
         
         with col2:
             st.markdown("**Question:**")
-            st.info(row['question'])
+            st.info(row.question)
             
             st.markdown("**Answer:**")
-            st.success(row['answer'][:500] + "..." if len(row['answer']) > 500 else row['answer'])
+            st.success(row.answer[:ANSWER_PREVIEW_CHARS] + "..." if len(row.answer) > ANSWER_PREVIEW_CHARS else row.answer)
 
 st.divider()
 
@@ -207,7 +289,7 @@ st.subheader("💾 Export Data")
 col1, col2 = st.columns(2)
 
 with col1:
-    csv = filtered_df.to_csv(index=False)
+    csv = build_csv(rating_filter, days_filter)
     st.download_button(
         label="📥 Download as CSV",
         data=csv,
@@ -2,7 +2,7 @@
 Database models and setup for feedback storage
 Using SQLAlchemy with SQLite (can easily switch to PostgreSQL for production)
 """
-from sqlalchemy import create_engine, Column, String, DateTime, Integer, Text
+from sqlalchemy import create_engine, event, Column, String, DateTime, Integer, Text, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
@@ -12,10 +12,26 @@ import os
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./feedback.db")
 
 # Create engine
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {}
-)
+if "sqlite" in DATABASE_URL:
+    engine = create_engine(
+        DATABASE_URL,
+        connect_args={"check_same_thread": False}
+    )
+    
+    # WAL lets dashboard reads run alongside feedback writes
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
+else:
+    engine = create_engine(
+        DATABASE_URL,
+        pool_size=10,
+        max_overflow=20,
+        pool_pre_ping=True
+    )
 
 # Session maker
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -28,7 +44,7 @@ class Feedback(Base):
     __tablename__ = "feedback"
     
     id = Column(Integer, primary_key=True, index=True)
-    session_id = Column(String, index=True, nullable=False)
+    session_id = Column(String, nullable=False)  # Indexed via ix_feedback_session_ts
     message_id = Column(String, index=True, nullable=False)  # Unique ID for each message
     question = Column(Text, nullable=False)
     answer = Column(Text, nullable=False)
@@ -36,6 +52,11 @@ class Feedback(Base):
     timestamp = Column(DateTime, default=datetime.utcnow, nullable=False)
     user_comment = Column(Text, nullable=True)  # Optional user comment
     
+    __table_args__ = (
+        Index('ix_feedback_session_ts', 'session_id', 'timestamp'),  # Session history, newest first
+        Index('ix_feedback_rating_ts', 'rating', 'timestamp'),  # Dashboard rating/date aggregates
+    )
+    
     def to_dict(self):
         return {
             "id": self.id,
@@ -51,6 +72,9 @@ class Feedback(Base):
 # Create tables
 def init_db():
     Base.metadata.create_all(bind=engine)
+    # create_all skips existing tables, so add any indexes they are missing
+    for index in Feedback.__table__.indexes:
+        index.create(bind=engine, checkfirst=True)
     print("✅ Database tables created successfully!")
 
 # Dependency to get DB session
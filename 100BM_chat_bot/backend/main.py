@@ -3,14 +3,17 @@ Simple FastAPI Backend - Direct conversion from Streamlit
 Uses your existing utils.py without modifications
 NOW WITH FEEDBACK SYSTEM
 """
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Query
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-import json
+from fastapi.middleware.gzip import GZipMiddleware
+from pydantic import BaseModel, ConfigDict
+import orjson
 import asyncio
 from typing import List, Dict, Optional
+from datetime import datetime
 import os
 from dotenv import load_dotenv
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 
 # Load environment variables
@@ -20,7 +23,7 @@ load_dotenv()
 from utils import ProfileAwareRAGSystem
 
 # Import database
-from database import init_db, get_db, Feedback
+from database import init_db, get_db, SessionLocal, Feedback
 
 # Simple request/response models
 class ChatRequest(BaseModel):
@@ -45,6 +48,51 @@ class FeedbackResponse(BaseModel):
     message: str
     feedback_id: int
 
+class FeedbackBulkRequest(BaseModel):
+    items: List[FeedbackRequest]
+
+class FeedbackBulkResponse(BaseModel):
+    success: bool
+    message: str
+    count: int
+
+class FeedbackItem(BaseModel):
+    model_config = ConfigDict(from_attributes=True)  # Built straight from Feedback rows
+    
+    id: int
+    session_id: str
+    message_id: str
+    question: str
+    answer: str
+    rating: str
+    timestamp: datetime
+    user_comment: Optional[str] = None
+
+class FeedbackListResponse(BaseModel):
+    feedback: List[FeedbackItem]
+
+class SessionFeedbackItem(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    
+    id: int
+    message_id: str
+    question: str
+    rating: str
+    timestamp: datetime
+    answer: Optional[str] = None  # Only with include_text
+    user_comment: Optional[str] = None  # Only with include_text
+
+class SessionFeedbackResponse(BaseModel):
+    session_id: str
+    feedback_count: int
+    feedback: List[SessionFeedbackItem]
+
+class FeedbackStatsResponse(BaseModel):
+    total_feedback: int
+    positive_count: int
+    negative_count: int
+    positive_percentage: float
+
 # Initialize FastAPI
 app = FastAPI(title="100BM AI Assistant API")
 
@@ -62,20 +110,50 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize your RAG system (same as Streamlit)
+# Compress JSON responses (SSE streams are left uncompressed by the middleware)
+app.add_middleware(GZipMiddleware, minimum_size=500)
+
+# Initialize your RAG system (same as Streamlit), loaded in the background at startup
 rag_system = None
+rag_ready = False  # True once the first retrieval has warmed the vector store
+rag_warmup_task: Optional[asyncio.Task] = None
+
+# Single feedback posts are queued and committed together by a background writer
+FEEDBACK_FLUSH_INTERVAL = 0.05  # seconds
+feedback_queue: Optional[asyncio.Queue] = None
+feedback_writer_task: Optional[asyncio.Task] = None
+
+async def warm_up_rag():
+    """Load the RAG system off the event loop, then run one throwaway retrieval"""
+    global rag_system, rag_ready
+    try:
+        print("🚀 Initializing RAG System...")
+        rag_system = await asyncio.to_thread(ProfileAwareRAGSystem, vector_store_path="./vector_store")
+        await asyncio.to_thread(rag_system.warmup)
+        rag_ready = True
+        print("✅ RAG System Ready!")
+    except Exception:
+        import traceback
+        traceback.print_exc()
 
 @app.on_event("startup")
 async def startup():
-    global rag_system
-    print("🚀 Initializing RAG System...")
-    rag_system = ProfileAwareRAGSystem(vector_store_path="./vector_store")
-    print("✅ RAG System Ready!")
+    global rag_warmup_task
+    rag_warmup_task = asyncio.create_task(warm_up_rag())
     
     # Initialize database
     print("🗄️ Initializing Database...")
     init_db()
     print("✅ Database Ready!")
+    
+    global feedback_queue, feedback_writer_task
+    feedback_queue = asyncio.Queue()
+    feedback_writer_task = asyncio.create_task(feedback_writer())
+
+@app.on_event("shutdown")
+async def shutdown():
+    if feedback_writer_task:
+        feedback_writer_task.cancel()
 
 @app.get("/")
 async def root():
@@ -83,7 +161,7 @@ async def root():
 
 @app.get("/api/health")
 async def health():
-    return {"status": "healthy", "rag_loaded": rag_system is not None}
+    return {"status": "healthy", "rag_loaded": rag_system is not None, "ready": rag_ready}
 
 @app.post("/api/chat")
 async def chat(request: ChatRequest):
@@ -92,8 +170,8 @@ async def chat(request: ChatRequest):
         raise HTTPException(status_code=503, detail="RAG system not initialized")
     
     try:
-        # Call your existing ask method
-        result = rag_system.ask(
+        # Async ask: retrieval and the LLM call are awaited, not blocking the event loop
+        result = await rag_system.aask(
             question=request.question,
             conversation_history=request.conversation_history
         )
@@ -115,10 +193,10 @@ async def chat_stream(request: ChatRequest):
     
     async def event_generator():
         try:
-            full_answer = ""
+            chunks = []
             
-            # Stream from your existing ask_stream method
-            for chunk in rag_system.ask_stream(
+            # Stream from the async ask_stream (retrieval overlaps profile detection)
+            async for chunk in rag_system.aask_stream(
                 question=request.question,
                 conversation_history=request.conversation_history
             ):
@@ -126,76 +204,131 @@ async def chat_stream(request: ChatRequest):
                 if chunk.startswith("__HISTORY_UPDATE__:"):
                     continue
                 
-                full_answer += chunk
+                chunks.append(chunk)
                 
                 # Send as Server-Sent Events
                 yield {
                     "event": "message",
-                    "data": json.dumps({"chunk": chunk})
+                    "data": orjson.dumps({"chunk": chunk}).decode()
                 }
-                await asyncio.sleep(0.01)
             
             # Send completion
             yield {
                 "event": "done",
-                "data": json.dumps({"done": True, "full_answer": full_answer})
+                "data": orjson.dumps({"done": True, "full_answer": "".join(chunks)}).decode()
             }
             
         except Exception as e:
             yield {
                 "event": "error",
-                "data": json.dumps({"error": str(e)})
+                "data": orjson.dumps({"error": str(e)}).decode()
             }
     
     return EventSourceResponse(event_generator())
 
+# ===== FEEDBACK WRITE QUEUE =====
+
+def write_feedback_batch(items: List[FeedbackRequest]) -> List[int]:
+    """Insert a batch of feedback in one transaction, returning the new IDs"""
+    db = SessionLocal()
+    try:
+        rows = [Feedback(**item.model_dump()) for item in items]
+        db.add_all(rows)
+        db.flush()
+        ids = [row.id for row in rows]
+        db.commit()
+        return ids
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+async def feedback_writer():
+    """Drain queued feedback every FEEDBACK_FLUSH_INTERVAL and commit it together"""
+    while True:
+        batch = [await feedback_queue.get()]
+        await asyncio.sleep(FEEDBACK_FLUSH_INTERVAL)
+        while not feedback_queue.empty():
+            batch.append(feedback_queue.get_nowait())
+        
+        try:
+            ids = await asyncio.to_thread(write_feedback_batch, [item for item, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            continue
+        
+        for (_, future), feedback_id in zip(batch, ids):
+            if not future.done():
+                future.set_result(feedback_id)
+
 # ===== FEEDBACK ENDPOINTS =====
 
 @app.post("/api/feedback", response_model=FeedbackResponse)
-async def submit_feedback(
-    feedback: FeedbackRequest,
-    db: Session = Depends(get_db)
-):
+async def submit_feedback(feedback: FeedbackRequest):
     """Submit user feedback for a message"""
+    # Validate rating
+    if feedback.rating not in ['positive', 'negative']:
+        raise HTTPException(
+            status_code=400, 
+            detail="Rating must be 'positive' or 'negative'"
+        )
+    
     try:
-        # Validate rating
-        if feedback.rating not in ['positive', 'negative']:
-            raise HTTPException(
-                status_code=400, 
-                detail="Rating must be 'positive' or 'negative'"
-            )
+        # Queue for the background writer and wait for its commit
+        future = asyncio.get_running_loop().create_future()
+        await feedback_queue.put((feedback, future))
+        feedback_id = await future
         
-        # Create feedback entry
-        db_feedback = Feedback(
-            session_id=feedback.session_id,
-            message_id=feedback.message_id,
-            question=feedback.question,
-            answer=feedback.answer,
-            rating=feedback.rating,
-            user_comment=feedback.user_comment
+        return FeedbackResponse(
+            success=True,
+            message="Feedback submitted successfully",
+            feedback_id=feedback_id
         )
         
-        db.add(db_feedback)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/feedback/bulk", response_model=FeedbackBulkResponse)
+async def submit_feedback_bulk(
+    request: FeedbackBulkRequest,
+    db: Session = Depends(get_db)
+):
+    """Submit several feedback entries in a single transaction"""
+    if any(item.rating not in ['positive', 'negative'] for item in request.items):
+        raise HTTPException(
+            status_code=400, 
+            detail="Rating must be 'positive' or 'negative'"
+        )
+    
+    try:
+        db.bulk_insert_mappings(Feedback, [item.model_dump() for item in request.items])
         db.commit()
-        db.refresh(db_feedback)
         
-        return FeedbackResponse(
+        return FeedbackBulkResponse(
             success=True,
             message="Feedback submitted successfully",
-            feedback_id=db_feedback.id
+            count=len(request.items)
         )
         
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/api/feedback/stats")
+@app.get("/api/feedback/stats", response_model=FeedbackStatsResponse)
 async def get_feedback_stats(db: Session = Depends(get_db)):
     """Get feedback statistics"""
     try:
-        total_feedback = db.query(Feedback).count()
-        positive_count = db.query(Feedback).filter(Feedback.rating == 'positive').count()
-        negative_count = db.query(Feedback).filter(Feedback.rating == 'negative').count()
+        counts = dict(
+            db.query(Feedback.rating, func.count(Feedback.id))
+            .group_by(Feedback.rating)
+            .all()
+        )
+        total_feedback = sum(counts.values())
+        positive_count = counts.get('positive', 0)
+        negative_count = counts.get('negative', 0)
         
         return {
             "total_feedback": total_feedback,
@@ -206,7 +339,7 @@ async def get_feedback_stats(db: Session = Depends(get_db)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/api/feedback/recent")
+@app.get("/api/feedback/recent", response_model=FeedbackListResponse)
 async def get_recent_feedback(
     limit: int = 10,
     db: Session = Depends(get_db)
@@ -219,27 +352,44 @@ async def get_recent_feedback(
             .all()
         
         return {
-            "feedback": [f.to_dict() for f in feedback_list]
+            "feedback": feedback_list
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/api/feedback/session/{session_id}")
+@app.get(
+    "/api/feedback/session/{session_id}",
+    response_model=SessionFeedbackResponse,
+    response_model_exclude_unset=True
+)
 async def get_session_feedback(
     session_id: str,
+    limit: int = Query(100, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+    include_text: bool = False,
     db: Session = Depends(get_db)
 ):
-    """Get all feedback for a specific session"""
+    """Get feedback for a specific session (newest first, answer/comment only if include_text)"""
     try:
-        feedback_list = db.query(Feedback)\
+        columns = [Feedback.id, Feedback.message_id, Feedback.question, Feedback.rating, Feedback.timestamp]
+        if include_text:
+            columns += [Feedback.answer, Feedback.user_comment]
+        
+        feedback_count = db.query(func.count(Feedback.id))\
+            .filter(Feedback.session_id == session_id)\
+            .scalar()
+        
+        feedback_list = db.query(*columns)\
             .filter(Feedback.session_id == session_id)\
             .order_by(Feedback.timestamp.desc())\
+            .offset(offset)\
+            .limit(limit)\
             .all()
         
         return {
             "session_id": session_id,
-            "feedback_count": len(feedback_list),
-            "feedback": [f.to_dict() for f in feedback_list]
+            "feedback_count": feedback_count,
+            "feedback": feedback_list
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -10,11 +10,22 @@ Features:
 - ✅ NEW: Remembers conversation history for follow-up questions
 - ✅ FIXED: Session-specific memory (not shared between users)
 """
+import io
 import os
+import json
 import re
-from typing import List, Dict, Any, Optional, Union
+import asyncio
+import threading
+from collections import OrderedDict, deque
+from itertools import islice
+from operator import itemgetter
+from typing import List, Dict, Any, Optional, Tuple, Union
 from datetime import datetime
 import time
+from functools import lru_cache
+from types import MappingProxyType
+import ahocorasick
+import httpx
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -23,19 +34,174 @@ load_dotenv()
 # LangChain Core
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser, JsonOutputParser
-from langchain_core.runnables import RunnablePassthrough
+from langchain_core.runnables import RunnablePassthrough, RunnableLambda
 from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
 
 # LangChain OpenAI
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+from openai import OpenAI, RateLimitError
 
 from langchain_chroma import Chroma
+from langchain_community.embeddings import InfinityEmbeddings
+
+
+# ============================================================================
+# PRECOMPILED PATTERNS
+# ============================================================================
+
+# "session 3" in a question -> filter retrieval to that session
+_SESSION_RE = re.compile(r'session\s+(\d+)', re.IGNORECASE)
+
+# Reference sections the model sometimes writes itself (we add our own),
+# alternated so the answer is scanned once
+_CLEANUP_RE = re.compile('|'.join((
+    r'📺?\s*Related Video Resources:.*?$',
+    r'📺?\s*For (?:more|further) details.*?$',
+    r'📚?\s*For more details.*?$',
+)), re.DOTALL | re.IGNORECASE)
+
+# Phrases meaning the user wants sources/references, matched in one pass
+_REFERENCE_RE = re.compile('|'.join(map(re.escape, (
+    'source', 'reference', 'where can i find', 'where is this from',
+    'which session', 'what video', 'where to learn more', 'more details',
+    'show source', 'cite', 'citation', 'what document', 'which document'
+))), re.IGNORECASE)
+
+_BLANKLINES_RE = re.compile(r'\n\n\n+')
+
+# Leading "01. " numbering on source filenames
+_FILENAME_NUMBER_RE = re.compile(r'^\d+\.\s*')
 
 
 # ============================================================================
 # PROFILE DETECTOR
 # ============================================================================
 
+# Static personalization context per predefined profile (read-only)
+_PROFILE_CONTEXTS = MappingProxyType({
+    'doctor': """
+    Healthcare professionals focused on:
+    - Patient outcomes and care quality
+    - Managing medical teams (residents, nurses)
+    - Clinical excellence and research
+    - Hospital administration and operations
+    - Board certification and advancement
+    - Balancing clinical work with leadership
+    """,
+    
+    'hr_leader': """
+    Human Resources leaders focused on:
+    - Talent acquisition and retention
+    - Employee development and engagement
+    - Organizational culture and change
+    - Performance management systems
+    - Strategic workforce planning
+    - Diversity, equity, and inclusion
+    """,
+    
+    'entrepreneur': """
+    Business founders focused on:
+    - Building and scaling businesses
+    - Product-market fit and growth
+    - Fundraising and investor relations
+    - Team building and leadership
+    - Customer acquisition and retention
+    - Managing limited resources effectively
+    """,
+    
+    'corporate_executive': """
+    Senior corporate leaders focused on:
+    - Strategic business decisions
+    - P&L management and growth
+    - Stakeholder management (board, investors)
+    - Organizational transformation
+    - Leading large teams (100+ people)
+    - Cross-functional collaboration
+    """,
+    
+    'consultant': """
+    Professional consultants focused on:
+    - Client engagement and delivery
+    - Problem-solving and recommendations
+    - Building credibility and expertise
+    - Managing multiple projects
+    - Thought leadership and positioning
+    - Business development
+    """,
+    
+    'engineer': """
+    Technical professionals focused on:
+    - Technical leadership and architecture
+    - Team management and mentoring
+    - Innovation and product development
+    - Balancing technical depth with leadership
+    - Cross-functional collaboration
+    - Strategic technology decisions
+    """,
+    
+    'lawyer': """
+    Legal professionals focused on:
+    - Case management and client service
+    - Legal strategy and advisory
+    - Team leadership and development
+    - Business development and partnerships
+    - Professional reputation
+    - Work-life balance in demanding field
+    """,
+    
+    'educator': """
+    Educational leaders focused on:
+    - Student outcomes and development
+    - Curriculum design and innovation
+    - Faculty/team management
+    - Institutional leadership
+    - Balancing teaching with administration
+    - Educational technology and methods
+    """,
+    
+    'finance': """
+    Financial professionals focused on:
+    - Financial planning and analysis
+    - Risk management and compliance
+    - Strategic financial decisions
+    - Investor relations and reporting
+    - Team leadership and development
+    - Business partnering with operations
+    """
+})
+
+_DEFAULT_PROFILE_CONTEXT = "Professional focused on leadership and growth"
+
+# Profile context blocks for the prompt (str.format-ready: prof, ctx)
+_CUSTOM_TPL = """
+USER PROFILE DETECTED: {prof}
+Profile Context: {ctx}
+
+IMPORTANT: Personalize examples for this profession while keeping the core framework intact!
+If the profession is unfamiliar, provide examples that could apply broadly to professional leadership.
+"""
+
+_NAMED_TPL = """
+USER PROFILE DETECTED: {prof}
+Profile Context: {ctx}
+
+IMPORTANT: Personalize examples for this profile while keeping the core framework intact!
+"""
+
+
+def _build_keyword_automaton(profile_keywords: Dict[str, List[str]]) -> ahocorasick.Automaton:
+    """Build an Aho-Corasick automaton mapping each keyword to (rank, profile, keyword)"""
+    automaton = ahocorasick.Automaton()
+    rank = 0
+    for profile, keywords in profile_keywords.items():
+        for keyword in keywords:
+            automaton.add_word(keyword, (rank, profile, keyword))
+            rank += 1
+    automaton.make_automaton()
+    return automaton
+
+
 class ProfileDetector:
     """
     Detects user's professional profile from their question
@@ -55,6 +221,18 @@ class ProfileDetector:
         'finance': ['finance', 'accountant', 'cfo', 'financial', 'banker'],
     }
     
+    # All keywords in one Aho-Corasick automaton: a single pass over the question
+    _PROFILE_AUTOMATON = _build_keyword_automaton(PROFILE_KEYWORDS)
+    
+    # Generic professional indicators
+    _PROFESSION_PATTERNS = [re.compile(pattern) for pattern in (
+        r'i am (?:a|an) ([a-z\s]+)',
+        r'as (?:a|an) ([a-z\s]+)',
+        r"i'm (?:a|an) ([a-z\s]+)",
+        r'working as (?:a|an) ([a-z\s]+)',
+    )]
+    _PROFESSION_END_RE = re.compile(r'\s+(?:how|what|where|when|why|can|do)')
+    
     @classmethod
     def detect_profile(cls, question: str) -> Optional[Dict[str, Any]]:
         """
@@ -63,29 +241,27 @@ class ProfileDetector:
         """
         question_lower = question.lower()
         
-        # Check each known profile
-        for profile, keywords in cls.PROFILE_KEYWORDS.items():
-            for keyword in keywords:
-                if keyword in question_lower:
-                    return {
-                        'profile': profile,
-                        'confidence': 'high',
-                        'detected_keyword': keyword
-                    }
+        # Check all known profiles in a single scan; the lowest-ranked hit is the
+        # first keyword in PROFILE_KEYWORDS order, same as checking each profile in turn
+        best = min(
+            (value for _, value in cls._PROFILE_AUTOMATON.iter(question_lower)),
+            default=None
+        )
+        
+        if best:
+            _, profile, keyword = best
+            return {
+                'profile': profile,
+                'confidence': 'high',
+                'detected_keyword': keyword
+            }
         
         # Check for generic professional indicators
-        profession_patterns = [
-            r'i am (?:a|an) ([a-z\s]+)',
-            r'as (?:a|an) ([a-z\s]+)',
-            r"i'm (?:a|an) ([a-z\s]+)",
-            r'working as (?:a|an) ([a-z\s]+)',
-        ]
-        
-        for pattern in profession_patterns:
-            match = re.search(pattern, question_lower)
+        for pattern in cls._PROFESSION_PATTERNS:
+            match = pattern.search(question_lower)
             if match:
                 profession = match.group(1).strip()
-                profession = re.split(r'\s+(?:how|what|where|when|why|can|do)', profession)[0]
+                profession = cls._PROFESSION_END_RE.split(profession)[0]
                 
                 if profession and len(profession.split()) <= 3:
                     return {
@@ -98,105 +274,14 @@ class ProfileDetector:
         return None
     
     @classmethod
+    @lru_cache(maxsize=32)
     def get_profile_context(cls, profile: str, custom_profile: str = None) -> str:
         """
         Get context about each profile for better personalization
         Handles both predefined and custom profiles
         """
-        contexts = {
-            'doctor': """
-            Healthcare professionals focused on:
-            - Patient outcomes and care quality
-            - Managing medical teams (residents, nurses)
-            - Clinical excellence and research
-            - Hospital administration and operations
-            - Board certification and advancement
-            - Balancing clinical work with leadership
-            """,
-            
-            'hr_leader': """
-            Human Resources leaders focused on:
-            - Talent acquisition and retention
-            - Employee development and engagement
-            - Organizational culture and change
-            - Performance management systems
-            - Strategic workforce planning
-            - Diversity, equity, and inclusion
-            """,
-            
-            'entrepreneur': """
-            Business founders focused on:
-            - Building and scaling businesses
-            - Product-market fit and growth
-            - Fundraising and investor relations
-            - Team building and leadership
-            - Customer acquisition and retention
-            - Managing limited resources effectively
-            """,
-            
-            'corporate_executive': """
-            Senior corporate leaders focused on:
-            - Strategic business decisions
-            - P&L management and growth
-            - Stakeholder management (board, investors)
-            - Organizational transformation
-            - Leading large teams (100+ people)
-            - Cross-functional collaboration
-            """,
-            
-            'consultant': """
-            Professional consultants focused on:
-            - Client engagement and delivery
-            - Problem-solving and recommendations
-            - Building credibility and expertise
-            - Managing multiple projects
-            - Thought leadership and positioning
-            - Business development
-            """,
-            
-            'engineer': """
-            Technical professionals focused on:
-            - Technical leadership and architecture
-            - Team management and mentoring
-            - Innovation and product development
-            - Balancing technical depth with leadership
-            - Cross-functional collaboration
-            - Strategic technology decisions
-            """,
-            
-            'lawyer': """
-            Legal professionals focused on:
-            - Case management and client service
-            - Legal strategy and advisory
-            - Team leadership and development
-            - Business development and partnerships
-            - Professional reputation
-            - Work-life balance in demanding field
-            """,
-            
-            'educator': """
-            Educational leaders focused on:
-            - Student outcomes and development
-            - Curriculum design and innovation
-            - Faculty/team management
-            - Institutional leadership
-            - Balancing teaching with administration
-            - Educational technology and methods
-            """,
-            
-            'finance': """
-            Financial professionals focused on:
-            - Financial planning and analysis
-            - Risk management and compliance
-            - Strategic financial decisions
-            - Investor relations and reporting
-            - Team leadership and development
-            - Business partnering with operations
-            """
-        }
-        
-        if profile in contexts:
-            return contexts[profile]
+        if profile in _PROFILE_CONTEXTS:
+            return _PROFILE_CONTEXTS[profile]
         
         if profile == 'custom' and custom_profile:
             return f"""
@@ -211,17 +296,25 @@ class ProfileDetector:
             Note: Adapt examples to this profession's context where relevant.
             """
         
-        return "Professional focused on leadership and growth"
+        return _DEFAULT_PROFILE_CONTEXT
+
+
+@lru_cache(maxsize=512)
+def _detect_profile_cached(normalized_question: str) -> Optional[Dict[str, Any]]:
+    """Memoized ProfileDetector.detect_profile keyed on the stripped, lowercased question"""
+    return ProfileDetector.detect_profile(normalized_question)
 
 
 # ============================================================================
 # PROFILE-AWARE PROMPT WITH CONVERSATION MEMORY
 # ============================================================================
 
+@lru_cache(maxsize=1)
 def get_profile_aware_prompt() -> ChatPromptTemplate:
     """
     Enhanced prompt that personalizes content based on user profile
     ✅ NOW includes conversation history awareness
+    ✅ Built once on first use and shared across requests
     """
     return ChatPromptTemplate.from_messages([
         ("system", """You are an expert assistant for the Iron Lady Leadership Program (100 Badass Women - 100BM).
@@ -296,10 +389,11 @@ class UniversalMetadataHandler:
     """Handles metadata from ANY file automatically"""
     
     @staticmethod
+    @lru_cache(maxsize=1024)
     def extract_clean_filename(source_file: str) -> str:
         """Extract clean, readable filename"""
         name = source_file.replace('.docx', '').replace('.pdf', '').replace('.txt', '')
-        name = re.sub(r'^\d+\.\s*', '', name)
+        name = _FILENAME_NUMBER_RE.sub('', name)
         return name.strip()
     
     @staticmethod
@@ -353,17 +447,82 @@ class UniversalMetadataHandler:
 class LLMFactory:
     """Factory for creating LLM instances"""
     
+    # Connection pool shared by every request through one ChatOpenAI instance
+    HTTP_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=50)
+    
     @staticmethod
+    @lru_cache(maxsize=8)
     def get_chat_llm(model: str = "gpt-4o-mini", temperature: float = 0.2, streaming: bool = True) -> ChatOpenAI:
-        """Get ChatOpenAI instance - slightly higher temp for personalization"""
+        """
+        Get ChatOpenAI instance - slightly higher temp for personalization
+        One shared instance (and keep-alive HTTP pool) per (model, temperature, streaming)
+        """
         return ChatOpenAI(
             model=model,
-            temperature=0.2,
-            streaming=True,
-            openai_api_key=os.getenv("OPENAI_API_KEY")
+            temperature=temperature,
+            streaming=streaming,
+            openai_api_key=os.getenv("OPENAI_API_KEY"),
+            http_client=httpx.Client(limits=LLMFactory.HTTP_LIMITS),
+            http_async_client=httpx.AsyncClient(limits=LLMFactory.HTTP_LIMITS)
         )
 
 
+# ============================================================================
+# QUERY EMBEDDING CACHE
+# ============================================================================
+
+class CachedQueryEmbeddings(Embeddings):
+    """
+    Wraps an embeddings model with an in-process LRU cache for query embeddings
+    Repeated / follow-up questions skip the embedding API round-trip
+    """
+    
+    def __init__(self, embeddings: Embeddings, maxsize: int = 2048):
+        self.embeddings = embeddings
+        self.maxsize = maxsize
+        self._cache: "OrderedDict[Tuple[str, str], List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def _key(self, text: str) -> Tuple[str, str]:
+        """Cache key: (model, whitespace-normalized text)"""
+        return (getattr(self.embeddings, 'model', ''), " ".join(text.split()))
+    
+    def _get(self, key: Tuple[str, str]) -> Optional[List[float]]:
+        with self._lock:
+            vector = self._cache.get(key)
+            if vector is not None:
+                self._cache.move_to_end(key)
+            return vector
+    
+    def _put(self, key: Tuple[str, str], vector: List[float]) -> None:
+        with self._lock:
+            self._cache[key] = vector
+            if len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+    
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+    
+    def embed_query(self, text: str) -> List[float]:
+        key = self._key(text)
+        vector = self._get(key)
+        if vector is None:
+            vector = self.embeddings.embed_query(key[1])
+            self._put(key, vector)
+        return vector
+    
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.embeddings.aembed_documents(texts)
+    
+    async def aembed_query(self, text: str) -> List[float]:
+        key = self._key(text)
+        vector = self._get(key)
+        if vector is None:
+            vector = await self.embeddings.aembed_query(key[1])
+            self._put(key, vector)
+        return vector
+
+
 # ============================================================================
 # VECTOR STORE LOADER
 # ============================================================================
@@ -373,11 +532,32 @@ class VectorStoreLoader:
     
     def __init__(self, persist_directory: str = "./vector_store"):
         self.persist_directory = persist_directory
-        self.embeddings = OpenAIEmbeddings(
+        self.embeddings = CachedQueryEmbeddings(self._create_embeddings())
+        self.vectorstore = None
+    
+    @staticmethod
+    def _create_embeddings() -> Embeddings:
+        """
+        Query embedding model - must match the model the store was built with
+        
+        - INFINITY_API_URL set: local Infinity server (no OpenAI round-trip per query);
+          the store has to be re-embedded with INFINITY_EMBEDDING_MODEL first
+        - otherwise: OpenAI text-embedding-3-large (shipped store), optionally
+          truncated to EMBEDDING_DIMENSIONS (e.g. 1024)
+        """
+        infinity_url = os.getenv("INFINITY_API_URL")
+        if infinity_url:
+            return InfinityEmbeddings(
+                model=os.getenv("INFINITY_EMBEDDING_MODEL", "intfloat/multilingual-e5-large-instruct"),
+                infinity_api_url=infinity_url
+            )
+        
+        dimensions = os.getenv("EMBEDDING_DIMENSIONS")
+        return OpenAIEmbeddings(
             model="text-embedding-3-large",
+            dimensions=int(dimensions) if dimensions else None,
             openai_api_key=os.getenv("OPENAI_API_KEY")
         )
-        self.vectorstore = None
     
     def load(self):
         """Load vector store"""
@@ -391,6 +571,21 @@ class VectorStoreLoader:
         return self.vectorstore
 
 
+@lru_cache(maxsize=4)
+def _get_shared_vector_store(persist_directory: str = "./vector_store") -> VectorStoreLoader:
+    """Load each vector store directory once per process and share it across RAG systems"""
+    loader = VectorStoreLoader(persist_directory=persist_directory)
+    loader.load()
+    return loader
+
+
+# LangChain message types -> OpenAI chat roles (Batch API request bodies)
+_OPENAI_ROLES = MappingProxyType({"system": "system", "human": "user", "ai": "assistant"})
+
+# Batch API statuses after which polling stops
+_BATCH_TERMINAL_STATUSES = frozenset({"completed", "failed", "expired", "cancelled"})
+
+
 # ============================================================================
 # PROFILE-AWARE RAG SYSTEM WITH SESSION-BASED MEMORY
 # ============================================================================
@@ -402,16 +597,34 @@ class ProfileAwareRAGSystem:
     ✅ FIXED: Memory is now passed from session state (not stored in this class)
     """
     
+    # Max aask() calls retrieving / generating at once (open aask_stream() streams count too)
+    MAX_CONCURRENT_QUERIES = 32
+    
+    # Per-query metric entries kept for get_metrics()
+    MAX_TRACKED_QUERIES = 1000
+    
+    # Session-filtered retrievers kept (the session number comes from user input)
+    MAX_SESSION_RETRIEVERS = 32
+    
+    # MMR search settings shared by the default and session-filtered retrievers
+    RETRIEVER_KWARGS = {"k": 8, "fetch_k": 20, "lambda_mult": 0.7}
+    
     def __init__(self, vector_store_path: str = "./vector_store"):
         print("🚀 Initializing Profile-Aware RAG System...")
         
-        # Load vector store
-        self.vector_store = VectorStoreLoader(persist_directory=vector_store_path)
-        self.vector_store.load()
+        # Load vector store (shared, opened once per process)
+        self.vector_store = _get_shared_vector_store(vector_store_path)
         
         # Initialize LLM with slight creativity for personalization
         self.llm = LLMFactory.get_chat_llm(temperature=0.2)
         
+        # Answer chain, built once and fed a dict per question
+        self._chain = self._build_chain()
+        self._retrying_chain = self._chain.with_retry(
+            retry_if_exception_type=(RateLimitError,),
+            stop_after_attempt=4
+        )
+        
         # Initialize components
         self.metadata_handler = UniversalMetadataHandler()
         self.profile_detector = ProfileDetector()
@@ -419,78 +632,204 @@ class ProfileAwareRAGSystem:
         # Create retriever with MMR
         self.retriever = self.vector_store.vectorstore.as_retriever(
             search_type="mmr",
-            search_kwargs={"k": 8, "fetch_k": 20, "lambda_mult": 0.7}
+            search_kwargs=self.RETRIEVER_KWARGS
         )
         
+        # Session-filtered MMR retrievers, built on first use per session number (LRU-bounded)
+        self._session_retrievers = OrderedDict()
+        
+        # Bounds concurrent retrieval + LLM calls from aask()/ask_batch()
+        self._query_semaphore = asyncio.Semaphore(self.MAX_CONCURRENT_QUERIES)
+        
         # Metrics
         self.metrics = {
             'query_count': 0,
             'total_latency': 0.0,
             'profile_detected_count': 0,
-            'queries': []
+            'queries': deque(maxlen=self.MAX_TRACKED_QUERIES)  # Bounded: oldest entries drop off
         }
         
         print("✓ Profile-Aware RAG System Ready!")
         print("✓ Supports: doctor, HR, entrepreneur, executive, and more!")
         print("✓ Conversation memory enabled (session-based)!")
     
+    def warmup(self) -> None:
+        """Run one throwaway retrieval so the embeddings client and vector index are warm"""
+        self.retriever.invoke("warmup")
+    
+    def _build_profile_context(self, question: str):
+        """
+        Detect the user's profile and build the profile context for the prompt
+        Shared by ask() and ask_stream(); returns (profile_info, profile_context)
+        """
+        profile_info = _detect_profile_cached(question.strip().lower())
+        
+        if not profile_info:
+            return None, "USER PROFILE: General professional\nProvide general examples from the context."
+        
+        profile_name = profile_info['profile']
+        custom_prof = profile_info.get('custom_profile', '')
+        
+        if profile_name == 'custom':
+            print(f"✓ Detected custom profile: {custom_prof} ({profile_info['detected_keyword']})")
+        else:
+            print(f"✓ Detected profile: {profile_name} ({profile_info['detected_keyword']})")
+        
+        if profile_name == 'custom':
+            profile_context = _CUSTOM_TPL.format(
+                prof=custom_prof.upper(),
+                ctx=self.profile_detector.get_profile_context(profile_name, custom_prof)
+            )
+        else:
+            profile_context = _NAMED_TPL.format(
+                prof=profile_name.upper().replace('_', ' '),
+                ctx=self.profile_detector.get_profile_context(profile_name)
+            )
+        
+        return profile_info, profile_context
+    
     def _is_asking_for_references(self, question: str) -> bool:
         """Check if user is explicitly asking for sources/references"""
-        question_lower = question.lower()
-        reference_keywords = [
-            'source', 'reference', 'where can i find', 'where is this from',
-            'which session', 'what video', 'where to learn more', 'more details',
-            'show source', 'cite', 'citation', 'what document', 'which document'
-        ]
-        return any(keyword in question_lower for keyword in reference_keywords)
+        return _REFERENCE_RE.search(question) is not None
     
     def _format_conversation_history(self, conversation_history: List[Dict]) -> str:
         """✅ Format conversation history for context"""
         if not conversation_history:
             return "No previous conversation."
         
-        formatted = []
-        for exchange in conversation_history[-10:]:  # Last 10 exchanges
-            formatted.append(f"User: {exchange['question']}")
-            formatted.append(f"Assistant: {exchange['answer'][:200]}...")
-        
-        return "\n".join(formatted)
+        # Last 10 exchanges; server-built entries carry a pre-truncated 'answer_preview',
+        # the React client's own history does not, so fall back to slicing here
+        return "\n".join(
+            f"User: {exchange['question']}\n"
+            f"Assistant: {exchange.get('answer_preview') or exchange['answer'][:200]}..."
+            for exchange in conversation_history[-10:]
+        )
     
     def _format_docs(self, docs: List[Document]) -> str:
         """Format documents with rich metadata"""
-        formatted = []
+        buf = io.StringIO()
+        extract_clean_filename = self.metadata_handler.extract_clean_filename
         
-        for doc in docs:
+        for i, doc in enumerate(docs):
+            if i:
+                buf.write("\n\n---\n\n")
+            
+            md = doc.metadata
+            if not md:
+                buf.write(doc.page_content)
+                continue
+            
+            get = md.get
             header_parts = []
             
-            source_file = doc.metadata.get('source_file', '')
+            source_file = get('source_file', '')
             if source_file:
-                clean_name = self.metadata_handler.extract_clean_filename(source_file)
+                clean_name = extract_clean_filename(source_file)
                 header_parts.append(f"Source: {clean_name}")
             
-            parent_folder = doc.metadata.get('parent_folder', '')
+            parent_folder = get('parent_folder', '')
             if parent_folder and parent_folder != 'lms_content':
                 header_parts.append(f"Category: {parent_folder}")
             
-            session_num = doc.metadata.get('session_number')
+            session_num = get('session_number')
             if session_num:
-                session_title = doc.metadata.get('session_title', '')
+                session_title = get('session_title', '')
                 if session_title:
                     header_parts.append(f"Session {session_num}: {session_title}")
                 else:
                     header_parts.append(f"Session {session_num}")
             
-            facilitator = doc.metadata.get('facilitator')
+            facilitator = get('facilitator')
             if facilitator:
                 header_parts.append(f"Facilitator: {facilitator}")
             
             if header_parts:
-                header = f"[{' | '.join(header_parts)}]"
-                formatted.append(f"{header}\n{doc.page_content}")
-            else:
-                formatted.append(doc.page_content)
+                buf.write("[")
+                buf.write(" | ".join(header_parts))
+                buf.write("]\n")
+            buf.write(doc.page_content)
+        
+        return buf.getvalue()
+    
+    def _get_retriever(self, question: str):
+        """MMR retriever, filtered to a session when the question names one ("session 3")"""
+        session_match = _SESSION_RE.search(question)
+        if not session_match:
+            return self.retriever
         
-        return "\n\n---\n\n".join(formatted)
+        session_num = int(session_match.group(1))
+        retriever = self._session_retrievers.get(session_num)
+        if retriever is None:
+            retriever = self.vector_store.vectorstore.as_retriever(
+                search_type="mmr",
+                search_kwargs={**self.RETRIEVER_KWARGS, "filter": {"session_number": session_num}}
+            )
+            self._session_retrievers[session_num] = retriever
+            if len(self._session_retrievers) > self.MAX_SESSION_RETRIEVERS:
+                self._session_retrievers.popitem(last=False)
+        else:
+            self._session_retrievers.move_to_end(session_num)
+        return retriever
+    
+    def _retrieve(self, question: str) -> List[Document]:
+        """Retrieve docs for the question"""
+        return self._get_retriever(question).invoke(question)
+    
+    async def _aretrieve(self, question: str) -> List[Document]:
+        """Async version of _retrieve()"""
+        return await self._get_retriever(question).ainvoke(question)
+    
+    def _build_chain(self):
+        """
+        Build the prompt | LLM | parser chain once
+        Input: {"context", "profile_context", "history", "question"} - so invoke/batch/abatch all work
+        """
+        return (
+            {
+                "context": itemgetter("context"),
+                "profile_context": itemgetter("profile_context"),
+                "conversation_history": RunnableLambda(lambda x: self._format_conversation_history(x["history"])),
+                "question": itemgetter("question")
+            }
+            | get_profile_aware_prompt()
+            | self.llm
+            | StrOutputParser()
+        )
+    
+    def _finalize_answer(self, question: str, answer: str, source_ref: Optional[str]) -> str:
+        """Strip model-written reference sections, add the source only if the user asked for it"""
+        answer = _CLEANUP_RE.sub('', answer).strip()
+        
+        # ✅ NEW: Only add reference if user explicitly asks for it
+        if self._is_asking_for_references(question) and source_ref:
+            answer += f"\n\n📚 {source_ref}"
+        
+        return _BLANKLINES_RE.sub('\n\n', answer).strip()
+    
+    def _history_entry(self, question: str, answer: str) -> Dict[str, Any]:
+        """One conversation history exchange, as returned to the caller in 'updated_history'"""
+        return {
+            'question': question,
+            'answer': answer,
+            'answer_preview': answer[:200],
+            'timestamp': time.time()
+        }
+    
+    def _record_query(self, question: str, profile_info: Optional[Dict[str, Any]], start_time: float) -> None:
+        """Track latency and profile for one answered query"""
+        now = time.time()
+        latency = now - start_time
+        self.metrics['query_count'] += 1
+        self.metrics['total_latency'] += latency
+        if profile_info:
+            self.metrics['profile_detected_count'] += 1
+        # Raw epoch seconds; formatted only when metrics are read
+        self.metrics['queries'].append({
+            'timestamp': now,
+            'question': question[:50] + '...',
+            'profile': profile_info['profile'] if profile_info else 'general',
+            'latency': latency
+        })
     
     def _get_primary_source_reference(self, retrieved_docs: List[Document]) -> Optional[str]:
         """Get source reference from primary document"""
@@ -520,48 +859,10 @@ class ProfileAwareRAGSystem:
         
         try:
             # STEP 1: Detect user profile
-            profile_info = self.profile_detector.detect_profile(question)
-            
-            if profile_info:
-                profile_name = profile_info['profile']
-                custom_prof = profile_info.get('custom_profile', '')
-                
-                if profile_name == 'custom':
-                    print(f"✓ Detected custom profile: {custom_prof} ({profile_info['detected_keyword']})")
-                else:
-                    print(f"✓ Detected profile: {profile_name} ({profile_info['detected_keyword']})")
-                
-                self.metrics['profile_detected_count'] += 1
-                
-                # Get profile context
-                if profile_name == 'custom':
-                    profile_context = f"""
-USER PROFILE DETECTED: {custom_prof.UPPER()}
-Profile Context: {self.profile_detector.get_profile_context(profile_name, custom_prof)}
-
-IMPORTANT: Personalize examples for this profession while keeping the core framework intact!
-If the profession is unfamiliar, provide examples that could apply broadly to professional leadership.
-"""
-                else:
-                    profile_context = f"""
-USER PROFILE DETECTED: {profile_name.upper().replace('_', ' ')}
-Profile Context: {self.profile_detector.get_profile_context(profile_name)}
-
-IMPORTANT: Personalize examples for this profile while keeping the core framework intact!
-"""
-            else:
-                profile_context = "USER PROFILE: General professional\nProvide general examples from the context."
+            profile_info, profile_context = self._build_profile_context(question)
             
             # STEP 2: Retrieve relevant content
-            session_match = re.search(r'session\s+(\d+)', question.lower())
-            
-            if session_match:
-                session_num = int(session_match.group(1))
-                retrieved_docs = self.vector_store.vectorstore.similarity_search(
-                    question, k=8, filter={"session_number": session_num}
-                )
-            else:
-                retrieved_docs = self.retriever.invoke(question)
+            retrieved_docs = self._retrieve(question)
             
             # STEP 3: Get source reference
             source_ref = self._get_primary_source_reference(retrieved_docs)
@@ -570,54 +871,71 @@ IMPORTANT: Personalize examples for this profile while keeping the core framewor
             context = self._format_docs(retrieved_docs)
             
             # STEP 5: Generate personalized answer with conversation history
-            prompt = get_profile_aware_prompt()
-            chain = (
-                {
-                    "context": lambda _: context,
-                    "profile_context": lambda _: profile_context,
-                    "conversation_history": lambda _: self._format_conversation_history(conversation_history),
-                    "question": lambda _: question
-                }
-                | prompt
-                | self.llm
-                | StrOutputParser()
-            )
-            
-            answer = chain.invoke({})
+            answer = self._chain.invoke({
+                "context": context,
+                "profile_context": profile_context,
+                "history": conversation_history,
+                "question": question
+            })
             
             # STEP 6: Clean up and add source ONLY if user is asking for it
-            patterns = [
-                r'📺?\s*Related Video Resources:.*?$',
-                r'📺?\s*For (?:more|further) details.*?$',
-                r'📚?\s*For more details.*?$',
-            ]
-            
-            for pattern in patterns:
-                answer = re.sub(pattern, '', answer, flags=re.DOTALL | re.IGNORECASE).strip()
+            answer = self._finalize_answer(question, answer, source_ref)
             
-            # ✅ NEW: Only add reference if user explicitly asks for it
-            if self._is_asking_for_references(question) and source_ref:
-                answer += f"\n\n📚 {source_ref}"
+            # ✅ Update conversation history (return to caller to store in session)
+            updated_history = conversation_history + [self._history_entry(question, answer)]
             
-            answer = re.sub(r'\n\n\n+', '\n\n', answer).strip()
+            # Track metrics
+            self._record_query(question, profile_info, start_time)
             
-            # ✅ Update conversation history (return to caller to store in session)
-            updated_history = conversation_history + [{
-                'question': question,
+            return {
                 'answer': answer,
-                'timestamp': datetime.now().isoformat()
-            }]
+                'updated_history': updated_history
+            }
             
-            # Track metrics
-            latency = time.time() - start_time
-            self.metrics['query_count'] += 1
-            self.metrics['total_latency'] += latency
-            self.metrics['queries'].append({
-                'timestamp': datetime.now().isoformat(),
-                'question': question[:50] + '...',
-                'profile': profile_info['profile'] if profile_info else 'general',
-                'latency': latency
-            })
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            return {
+                'answer': f"⚠️ Error: {str(e)}",
+                'updated_history': conversation_history
+            }
+    
+    async def aask(self, question: str, conversation_history: List[Dict] = None) -> Dict[str, Any]:
+        """
+        Async version of ask() for concurrent callers
+        
+        Retrieval and the LLM call are awaited (bounded by MAX_CONCURRENT_QUERIES),
+        and the LLM call backs off and retries on OpenAI rate limits.
+        
+        Returns:
+            Dict with 'answer' and 'updated_history'
+        """
+        start_time = time.time()
+        
+        if conversation_history is None:
+            conversation_history = []
+        
+        try:
+            profile_info, profile_context = self._build_profile_context(question)
+            
+            async with self._query_semaphore:
+                retrieved_docs = await self._aretrieve(question)
+                
+                source_ref = self._get_primary_source_reference(retrieved_docs)
+                context = self._format_docs(retrieved_docs)
+                
+                answer = await self._retrying_chain.ainvoke({
+                    "context": context,
+                    "profile_context": profile_context,
+                    "history": conversation_history,
+                    "question": question
+                })
+            
+            answer = self._finalize_answer(question, answer, source_ref)
+            
+            updated_history = conversation_history + [self._history_entry(question, answer)]
+            
+            self._record_query(question, profile_info, start_time)
             
             return {
                 'answer': answer,
@@ -632,6 +950,98 @@ IMPORTANT: Personalize examples for this profile while keeping the core framewor
                 'updated_history': conversation_history
             }
     
+    async def ask_batch(self, requests: List[Tuple[str, Optional[List[Dict]]]]) -> List[Dict[str, Any]]:
+        """
+        Answer independent (question, conversation_history) pairs concurrently
+        Results are returned in the same order as the requests
+        """
+        return await asyncio.gather(*[
+            self.aask(question, conversation_history)
+            for question, conversation_history in requests
+        ])
+    
+    def evaluate_batch(self, questions: List[str], poll_interval: float = 30.0) -> List[Dict[str, Any]]:
+        """
+        Answer independent questions through the OpenAI Batch API (offline evaluation only)
+        
+        Retrieval and prompts are built locally, then all chat completions are uploaded
+        as one JSONL batch (half the realtime price, finishes within 24h). Blocks while
+        polling; ask()/ask_stream() stay on the realtime endpoint.
+        
+        Returns:
+            List of dicts with 'question', 'profile' and 'answer', in the same order as questions
+        """
+        prompt = get_profile_aware_prompt()
+        jobs = []
+        buf = io.StringIO()
+        
+        for i, question in enumerate(questions):
+            profile_info, profile_context = self._build_profile_context(question)
+            retrieved_docs = self._retrieve(question)
+            messages = prompt.format_messages(
+                context=self._format_docs(retrieved_docs),
+                profile_context=profile_context,
+                conversation_history=self._format_conversation_history([]),
+                question=question
+            )
+            buf.write(json.dumps({
+                "custom_id": f"q-{i}",
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {
+                    "model": self.llm.model_name,
+                    "temperature": self.llm.temperature,
+                    "messages": [
+                        {"role": _OPENAI_ROLES[message.type], "content": message.content}
+                        for message in messages
+                    ]
+                }
+            }))
+            buf.write("\n")
+            jobs.append((question, profile_info, self._get_primary_source_reference(retrieved_docs)))
+        
+        client = OpenAI()
+        input_file = client.files.create(
+            file=("eval_batch.jsonl", buf.getvalue().encode("utf-8")),
+            purpose="batch"
+        )
+        batch = client.batches.create(
+            input_file_id=input_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h"
+        )
+        print(f"📦 Submitted batch {batch.id} ({len(jobs)} questions)")
+        
+        while batch.status not in _BATCH_TERMINAL_STATUSES:
+            time.sleep(poll_interval)
+            batch = client.batches.retrieve(batch.id)
+        
+        if batch.status != "completed":
+            raise RuntimeError(f"Batch {batch.id} ended with status '{batch.status}'")
+        
+        # Output lines come back in any order; failed requests only appear in the error file
+        answers = {}
+        if batch.output_file_id:
+            for line in client.files.content(batch.output_file_id).text.splitlines():
+                record = json.loads(line)
+                response = record.get("response") or {}
+                if response.get("status_code") == 200:
+                    answers[record["custom_id"]] = response["body"]["choices"][0]["message"]["content"]
+        
+        results = []
+        for i, (question, profile_info, source_ref) in enumerate(jobs):
+            answer = answers.get(f"q-{i}")
+            results.append({
+                'question': question,
+                'profile': profile_info['profile'] if profile_info else 'general',
+                'answer': (
+                    self._finalize_answer(question, answer, source_ref)
+                    if answer is not None else "⚠️ Error: no result returned for this question"
+                )
+            })
+        
+        return results
+    
     def ask_stream(self, question: str, conversation_history: List[Dict] = None):
         """
         Stream answer with profile personalization + conversation memory
@@ -645,39 +1055,10 @@ IMPORTANT: Personalize examples for this profile while keeping the core framewor
         
         try:
             # Detect profile
-            profile_info = self.profile_detector.detect_profile(question)
-            
-            if profile_info:
-                profile_name = profile_info['profile']
-                custom_prof = profile_info.get('custom_profile', '')
-                
-                self.metrics['profile_detected_count'] += 1
-                
-                if profile_name == 'custom':
-                    profile_context = f"""
-USER PROFILE DETECTED: {custom_prof.upper()}
-Profile Context: {self.profile_detector.get_profile_context(profile_name, custom_prof)}
-IMPORTANT: Personalize examples for this profession!
-"""
-                else:
-                    profile_context = f"""
-USER PROFILE DETECTED: {profile_name.upper().replace('_', ' ')}
-Profile Context: {self.profile_detector.get_profile_context(profile_name)}
-IMPORTANT: Personalize examples for this profile!
-"""
-            else:
-                profile_context = "USER PROFILE: General professional"
+            profile_info, profile_context = self._build_profile_context(question)
             
             # Retrieve content
-            session_match = re.search(r'session\s+(\d+)', question.lower())
-            
-            if session_match:
-                session_num = int(session_match.group(1))
-                retrieved_docs = self.vector_store.vectorstore.similarity_search(
-                    question, k=8, filter={"session_number": session_num}
-                )
-            else:
-                retrieved_docs = self.retriever.invoke(question)
+            retrieved_docs = self._retrieve(question)
             
             # Get source
             source_ref = self._get_primary_source_reference(retrieved_docs)
@@ -686,49 +1067,81 @@ IMPORTANT: Personalize examples for this profile!
             context = self._format_docs(retrieved_docs)
             
             # Stream answer with conversation history
-            prompt = get_profile_aware_prompt()
-            chain = (
-                {
-                    "context": lambda _: context,
-                    "profile_context": lambda _: profile_context,
-                    "conversation_history": lambda _: self._format_conversation_history(conversation_history),
-                    "question": lambda _: question
-                }
-                | prompt
-                | self.llm
-                | StrOutputParser()
-            )
-            
-            full_answer = ""
-            for chunk in chain.stream({}):
+            chunks = []
+            for chunk in self._chain.stream({
+                "context": context,
+                "profile_context": profile_context,
+                "history": conversation_history,
+                "question": question
+            }):
                 if chunk:
-                    full_answer += chunk
+                    chunks.append(chunk)
                     yield chunk
+            full_answer = "".join(chunks)
             
             # ✅ NEW: Only add reference if user explicitly asks for it
             if self._is_asking_for_references(question) and source_ref:
                 yield f"\n\n📚 {source_ref}"
             
             # ✅ Return updated history (caller will store in session)
-            updated_history = conversation_history + [{
-                'question': question,
-                'answer': full_answer,
-                'timestamp': datetime.now().isoformat()
-            }]
+            updated_history = conversation_history + [self._history_entry(question, full_answer)]
             
             # Yield special marker with updated history
             yield f"__HISTORY_UPDATE__:{len(updated_history)}"
             
             # Track metrics
-            latency = time.time() - start_time
-            self.metrics['query_count'] += 1
-            self.metrics['total_latency'] += latency
-            self.metrics['queries'].append({
-                'timestamp': datetime.now().isoformat(),
-                'question': question[:50] + '...',
-                'profile': profile_info['profile'] if profile_info else 'general',
-                'latency': latency
-            })
+            self._record_query(question, profile_info, start_time)
+            
+        except Exception as e:
+            yield f"\n\n⚠️ Error: {str(e)}"
+    
+    async def aask_stream(self, question: str, conversation_history: List[Dict] = None):
+        """
+        Async version of ask_stream()
+        
+        Retrieval is started first and runs in the executor while the profile
+        context is built on the loop; the answer is streamed with astream.
+        
+        A stream holds one MAX_CONCURRENT_QUERIES slot until the caller has consumed
+        every chunk, so slow stream readers count against the same limit as aask().
+        """
+        start_time = time.time()
+        
+        if conversation_history is None:
+            conversation_history = []
+        
+        try:
+            async with self._query_semaphore:
+                # Retrieval and profile detection are independent, overlap them:
+                # yield once so the retrieval task reaches its executor job first
+                docs_task = asyncio.create_task(self._aretrieve(question))
+                await asyncio.sleep(0)
+                profile_info, profile_context = self._build_profile_context(question)
+                retrieved_docs = await docs_task
+                
+                source_ref = self._get_primary_source_reference(retrieved_docs)
+                context = self._format_docs(retrieved_docs)
+                
+                chunks = []
+                async for chunk in self._chain.astream({
+                    "context": context,
+                    "profile_context": profile_context,
+                    "history": conversation_history,
+                    "question": question
+                }):
+                    if chunk:
+                        chunks.append(chunk)
+                        yield chunk
+                full_answer = "".join(chunks)
+            
+            if self._is_asking_for_references(question) and source_ref:
+                yield f"\n\n📚 {source_ref}"
+            
+            updated_history = conversation_history + [self._history_entry(question, full_answer)]
+            
+            yield f"__HISTORY_UPDATE__:{len(updated_history)}"
+            
+            self._record_query(question, profile_info, start_time)
             
         except Exception as e:
             yield f"\n\n⚠️ Error: {str(e)}"
@@ -736,7 +1149,7 @@ IMPORTANT: Personalize examples for this profile!
     def get_metrics(self) -> Dict[str, Any]:
         """Get metrics including profile detection stats"""
         if self.metrics['query_count'] == 0:
-            return self.metrics
+            return {**self.metrics, 'queries': []}
         
         avg_latency = self.metrics['total_latency'] / self.metrics['query_count']
         profile_detection_rate = (self.metrics['profile_detected_count'] / self.metrics['query_count']) * 100
@@ -747,7 +1160,10 @@ IMPORTANT: Personalize examples for this profile!
             'detection_rate': f"{profile_detection_rate:.1f}%",
             'average_latency': f"{avg_latency:.2f}s",
             'total_time': f"{self.metrics['total_latency']:.2f}s",
-            'recent_queries': self.metrics['queries'][-5:]
+            'recent_queries': [
+                {**query, 'timestamp': datetime.fromtimestamp(query['timestamp']).isoformat()}
+                for query in list(islice(reversed(self.metrics['queries']), 5))[::-1]
+            ]
         }
 
 
@@ -755,8 +1171,8 @@ IMPORTANT: Personalize examples for this profile!
 # TESTING
 # ============================================================================
 
-def main():
-    """Test profile-aware system"""
+async def main():
+    """Test profile-aware system (independent questions run concurrently)"""
     print("="*80)
     print("🚀 PROFILE-AWARE RAG SYSTEM with SESSION MEMORY - Customized 100BM Delivery")
     print("="*80)
@@ -775,19 +1191,25 @@ def main():
     print("\n📝 Testing Profile-Based Personalization...")
     print("="*80)
     
-    session_history = []
+    # Each question is a separate user, so they can run concurrently
+    results = await rag.ask_batch([(question, []) for question in test_questions])
     
-    for i, question in enumerate(test_questions, 1):
+    for i, (question, result) in enumerate(zip(test_questions, results), 1):
         print(f"\n{i}. Question: {question}")
         print("-" * 40)
-        
-        result = rag.ask(question, conversation_history=session_history)
-        answer = result['answer']
-        session_history = result['updated_history']
-        
-        print(f"Answer: {answer[:300]}...")
+        print(f"Answer: {result['answer'][:300]}...")
         print("-" * 40)
     
+    # Follow-up in the first user's session depends on its history, so it runs after
+    follow_up = "How does the first T apply to managing my residents?"
+    result = await rag.aask(follow_up, conversation_history=results[0]['updated_history'])
+    session_history = result['updated_history']
+    
+    print(f"\n{len(test_questions) + 1}. Follow-up: {follow_up}")
+    print("-" * 40)
+    print(f"Answer: {result['answer'][:300]}...")
+    print("-" * 40)
+    
     # Show metrics
     print("\n📊 Metrics:")
     metrics = rag.get_metrics()
@@ -802,4 +1224,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    asyncio.run(main())
\ No newline at end of file